@@ -1,25 +1,118 @@
-import json
+import re
 import time
+import asyncio
 import logging
 import os
+import threading
+import discord
+import orjson
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from src.connections.postgres import DatabaseHandler
 from src.connection_manager import ConnectionManager
 from src.helpers import print_h_bar
 
-REQUIRED_FIELDS = ["name", "bio", "traits", "examples", "loop_delay", "config"]
+REQUIRED_FIELDS = ["name", "bio", "traits", "examples", "config"]
 
 logger = logging.getLogger("agent")
 
+MAX_CONCURRENT_REPLIES = 4  # Messages handled at once
+REPLY_ATTEMPTS = 3  # Tries per message before giving up on it
+REPLY_RETRY_DELAY = 2  # Seconds before the first retry, doubled after each failed attempt
+GATEWAY_RETRY_DELAY = 5  # Seconds before reconnecting after the gateway connection fails
+MAX_BACKFILL_PAGES = 5  # Pages of missed messages read on (re)connect before giving up on the rest
+MAX_CONCURRENT_DISCORD_WRITES = 3  # Reply posts/edits in flight at once; this caps concurrency, not rate
+DISCORD_CHANNEL_WRITE_LIMIT = 5  # Posts/edits allowed per channel in each window, matching Discord's per-channel limit
+DISCORD_CHANNEL_WRITE_WINDOW = 5  # Seconds in that window
+REPLY_EDIT_INTERVAL = 1.5  # Seconds between progressive edits of a streamed reply
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Names the agent treats as bots; messages by or @mentioning any of them are skipped
+BOT_NAMES = ["zerecall"]
+
+# Bot detection compiled into one precompiled alternation per check (the mention pattern
+# also matches <@name). re still tries each name at every position, which is fine for a
+# handful of names; an Aho-Corasick automaton would be the next step for long lists.
+# An empty BOT_NAMES falls back to a pattern that never matches, not one that matches everything.
+_BOT_NAMES_PATTERN = "|".join(re.escape(name) for name in BOT_NAMES) or r"(?!)"
+_BOT_AUTHOR_RE = re.compile(_BOT_NAMES_PATTERN, re.IGNORECASE)
+_BOT_MENTION_RE = re.compile(f"@(?:{_BOT_NAMES_PATTERN})", re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def _parse_agent_file(agent_path: Path, mtime_ns: int) -> dict:
+    """Parse an agent file, cached until the file is modified"""
+    return orjson.loads(agent_path.read_bytes())
+
+def _load_agent(agent_name: str) -> dict:
+    """Load the agents/{name}.json config"""
+    agent_path = Path("agents") / f"{agent_name}.json"
+    return _parse_agent_file(agent_path, agent_path.stat().st_mtime_ns)
+
+class ChannelRateLimiter:
+    """Token bucket per channel that blocks writers until a request fits in the rate limit"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.rate = limit / window  # Tokens refilled per second
+        self._buckets = {}  # channel_id -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def acquire(self, channel_id: str):
+        """Take a token for the channel, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(channel_id, (self.limit, now))
+                tokens = min(self.limit, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[channel_id] = (tokens - 1, now)
+                    return
+                self._buckets[channel_id] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+class DiscordGatewayClient(discord.Client):
+    """Discord gateway client that hands new channel messages to the agent as they arrive"""
+
+    def __init__(self, agent: "DiscordAgent"):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        super().__init__(intents=intents)
+        self.agent = agent
+        self.reply_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REPLIES)
+
+    async def on_ready(self):
+        logger.info(f"Connected to Discord gateway as {self.user}")
+        # Catch up on anything posted before (or while) the gateway connected;
+        # claim_message keeps this from double-replying to messages also delivered as events
+        await self.agent.process_new_messages_async(self.reply_semaphore)
+
+    async def on_message(self, message: discord.Message):
+        if str(message.channel.id) != self.agent.channel_id or message.author.bot:
+            return
+
+        msg = {
+            "id": str(message.id),
+            "author": message.author.name,
+            "message": message.content,
+        }
+        if self.agent._is_bot_message(msg):
+            logger.debug("Skipping bot-related message: %s", msg['id'])
+            return
+
+        logger.info(f"Received new message to process: {msg['id']}")
+        await self.agent._handle_message_async(msg, self.reply_semaphore)
+        self.agent._advance_cursor(msg['id'])
+
 class DiscordAgent:
     def __init__(
             self,
             agent_name: str
     ):
         try:
-            agent_path = Path("agents") / f"{agent_name}.json"
-            agent_dict = json.load(open(agent_path, "r"))
+            agent_dict = _load_agent(agent_name)
 
             missing_fields = [field for field in REQUIRED_FIELDS if field not in agent_dict]
             if missing_fields:
@@ -30,14 +123,27 @@ class DiscordAgent:
             # Initialize basic attributes
             self.name = agent_dict["name"]
             self.bio = agent_dict["bio"]
+            # Invariant prompt parts, built once instead of on every reply
+            self._bio_prompt = "\n".join(self.bio)
+            self._prompt_prefix = "Generate a reply to this message: '"
+            self._prompt_suffix = f"'. You are {self.name}, an agent with technical expertise, so your responses may include code snippets or technical explanations based on the query and your context. Discord chats use markdown, so you can take advantage of creating rich text responses that include code blocks, lists, and more. Due to limitations in the Discord response length, your <think></think> logs together with your response will need to be 2000 or fewer in length."
             self.channel_id = os.getenv("CHANNEL_ID")  # Your specific channel ID
-            self.loop_delay = agent_dict["loop_delay"]
+            # Deprecated: replies are driven by gateway events, so nothing waits on loop_delay anymore
+            self.loop_delay = agent_dict.get("loop_delay")
             self.message_read_count = 10  # Number of messages to read each time
             self.is_llm_set = False
 
             # Set up database handler
             self.db = DatabaseHandler()
 
+            # Bounded worker pool that all reply posts and edits are queued on; the
+            # per-channel limiter in front of each write is what keeps them under Discord's rate limit
+            self._discord_writer = ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_DISCORD_WRITES,
+                thread_name_prefix="discord-writer"
+            )
+            self._write_limiter = ChannelRateLimiter(DISCORD_CHANNEL_WRITE_LIMIT, DISCORD_CHANNEL_WRITE_WINDOW)
+
             # Initialize connection manager
             self.connection_manager = ConnectionManager(agent_dict["config"])
 
@@ -69,18 +175,17 @@ class DiscordAgent:
 
     def _get_latest_message_id(self) -> str:
         """Get the ID of the latest message in the channel"""
-        try:
-            messages = self.read_messages()
-            print(messages)
-            if messages and len(messages) > 0:
-                latest_id = messages[0]['id']
-                logger.info(f"Got latest message ID: {latest_id}")
-                return latest_id
-            logger.warning("No messages found to initialize from")
-            return None
-        except Exception as e:
-            logger.error(f"Failed to get latest message ID: {e}")
-            return None
+        # Read through the connection directly so a failed read raises instead of looking like
+        # an empty channel, which would start the backfill from the beginning of the channel
+        messages = self.connection_manager.connections["discord"].read_messages(
+            self.channel_id, self.message_read_count
+        )
+        if messages:
+            latest_id = max((msg['id'] for msg in messages), key=int)
+            logger.info(f"Got latest message ID: {latest_id}")
+            return latest_id
+        logger.warning("No messages found to initialize from")
+        return None
 
     def _setup_llm_provider(self):
         """Setup LLM provider for message generation"""
@@ -90,10 +195,10 @@ class DiscordAgent:
         self.model_provider = llm_providers[0]
         self.is_llm_set = True
 
-    def _generate_reply(self, original_message: str) -> str:
-        """Generate a reply to a specific message"""
-        prompt = f"Generate a reply to this message: '{original_message}'. You are {self.name}, an agent with technical expertise, so your responses may include code snippets or technical explanations based on the query and your context. Discord chats use markdown, so you can take advantage of creating rich text responses that include code blocks, lists, and more. Due to limitations in the Discord response length, your <think></think> logs together with your response will need to be 2000 or fewer in length."
-        system_prompt = "\n".join(self.bio)
+    def _build_prompts(self, original_message: str) -> tuple:
+        """Build the user and system prompts for replying to a message"""
+        prompt = self._prompt_prefix + original_message + self._prompt_suffix
+        system_prompt = self._bio_prompt
         similar_content = self.db.get_similar_content(original_message)
         if similar_content:
             context = "\nRelevant context:\n"
@@ -101,36 +206,127 @@ class DiscordAgent:
                 context += f"- {content}\n"
             # append similar content to the system prompt with an indicator that this is relevant context
             system_prompt += '\n' + 'This is relevant context:\n' + context
-        
+
+        return prompt, system_prompt
+
+    def _generate_reply(self, original_message: str) -> str:
+        """Generate a reply to a specific message"""
+        prompt, system_prompt = self._build_prompts(original_message)
         return self.connection_manager.perform_action(
             connection_name=self.model_provider,
             action_name="generate-text",
             params=[prompt, system_prompt]
         )
 
-    def read_messages(self) -> list:
-        """Read recent messages from the channel"""
+    def read_messages(self, after: str = None) -> list:
+        """Read recent messages from the channel, optionally only those after a message ID"""
+        params = [self.channel_id, self.message_read_count]
+        if after:
+            params.append(after)
         try:
             messages = self.connection_manager.perform_action(
                 connection_name="discord",
                 action_name="read-messages",
-                params=[self.channel_id, self.message_read_count]
+                params=params
             )
             return messages if messages else []
         except Exception as e:
             logger.error(f"Failed to read messages: {e}")
             return []
 
+    def _stream_reply(self, message_id: str, original_message: str) -> tuple:
+        """Stream a generated reply into Discord, editing it as text arrives"""
+        prompt, system_prompt = self._build_prompts(original_message)
+        chunks = self.connection_manager.perform_action(
+            connection_name=self.model_provider,
+            action_name="stream-text",
+            params=[prompt, system_prompt]
+        )
+        if chunks is None:
+            return None, None
+
+        parts = []
+        posted = None
+        pending_edit = None
+        last_edit = 0.0
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                now = time.monotonic()
+                if now - last_edit < REPLY_EDIT_INTERVAL:
+                    continue
+                # Keep at most one edit in flight per reply so edits land in order
+                if pending_edit is not None and not pending_edit.done():
+                    continue
+                partial = "".join(parts)[:DISCORD_MESSAGE_LIMIT]
+                if not partial.strip():
+                    continue
+                if posted is None:
+                    # The first post is awaited since later edits need its message id
+                    posted = self._queue_reply_write(message_id, None, partial).result()
+                    if not posted:
+                        return None, None
+                else:
+                    # Edits go out in the background while generation continues
+                    pending_edit = self._queue_reply_write(message_id, posted, partial)
+                last_edit = now
+        except Exception as e:
+            # Once part of the reply is visible the message counts as replied, so keep what we have
+            if posted is None:
+                raise
+            logger.warning(f"Reply stream for message {message_id} ended early: {e}")
+        finally:
+            # Close the model stream if we stopped reading it early
+            chunks.close()
+
+        reply = "".join(parts)
+        if not reply.strip():
+            # Discord rejects empty messages, and nothing was posted for an empty stream
+            logger.warning(f"Model returned an empty reply for message {message_id}")
+            return None, None
+
+        if pending_edit is not None:
+            try:
+                pending_edit.result()
+            except Exception as e:
+                # A failed progressive edit is superseded by the final edit below
+                logger.warning(f"Progressive edit of reply to message {message_id} failed: {e}")
+
+        try:
+            result = self._queue_reply_write(message_id, posted, reply[:DISCORD_MESSAGE_LIMIT]).result()
+        except Exception as e:
+            if posted is None:
+                raise
+            # The partial reply is already posted, so a failed final edit does not fail the message
+            logger.warning(f"Failed to finish editing reply to message {message_id}: {e}")
+            result = posted
+        return reply, result
+
+    def _queue_reply_write(self, message_id: str, posted: dict, text: str) -> Future:
+        """Queue a reply post or edit on the bounded Discord writer pool"""
+        return self._discord_writer.submit(self._post_or_edit_reply, message_id, posted, text)
+
+    def _post_or_edit_reply(self, message_id: str, posted: dict, text: str) -> dict:
+        """Post the reply on the first call, then edit the posted reply"""
+        # Call the connection directly, since perform_action re-checks the Discord token on every call
+        discord_connection = self.connection_manager.connections["discord"]
+        self._write_limiter.acquire(self.channel_id)
+        if posted is None:
+            return discord_connection.reply_to_message(self.channel_id, message_id, text)
+        return discord_connection.edit_message(self.channel_id, posted['id'], text)
+
     def reply_to_message(self, message_id: str, original_message: str) -> bool:
         """Reply to a specific message"""
         try:
-            reply = self._generate_reply(original_message)
-            
-            result = self.connection_manager.perform_action(
-                connection_name="discord",
-                action_name="reply-to-message",
-                params=[self.channel_id, message_id, reply]
-            )
+            provider = self.connection_manager.connections[self.model_provider]
+            if "stream-text" in provider.actions:
+                reply, result = self._stream_reply(message_id, original_message)
+            else:
+                reply = self._generate_reply(original_message)
+                if not reply or not reply.strip():
+                    logger.warning(f"Model returned an empty reply for message {message_id}")
+                    return False
+                result = self._queue_reply_write(message_id, None, reply[:DISCORD_MESSAGE_LIMIT]).result()
             
             if result:
                 logger.info(f"Successfully replied to message: '{original_message}' with: '{reply}'")
@@ -141,53 +337,109 @@ class DiscordAgent:
             logger.error(f"Failed to reply to message: {e}")
             return False
 
+    def _is_bot_message(self, msg: dict) -> bool:
+        """Check whether a message is from or references the bot"""
+        # Skip if it's any kind of bot message or reference:
+        # 1. From the bot (APP in author)
+        # 2. Message references/mentions the bot (@zerecall)
+        # 3. Message is a reply to a bot message
+        author = msg.get('author', '')
+        return bool('APP' in author or
+                    _BOT_AUTHOR_RE.search(author) or
+                    _BOT_MENTION_RE.search(msg.get('message', '')))
+
+    def _handle_message(self, message: dict) -> bool:
+        """Claim and reply to a message, retrying failed replies, returning False if all attempts failed"""
+        msg_id = message['id']
+
+        # Claim the message in the database, skipping it if it was already replied to
+        if not self.db.claim_message(self.channel_id, msg_id):
+            logger.debug("Skipping already replied message: %s", msg_id)
+            return True
+
+        delay = REPLY_RETRY_DELAY
+        for attempt in range(1, REPLY_ATTEMPTS + 1):
+            if self.reply_to_message(msg_id, message.get('message', '')):
+                logger.info(f"Successfully processed message {msg_id}")
+                return True
+            if attempt < REPLY_ATTEMPTS:
+                logger.warning(f"Reply to message {msg_id} failed (attempt {attempt}), retrying in {delay}s")
+                time.sleep(delay)
+                delay *= 2
+
+        logger.error(f"Giving up on message {msg_id} after {REPLY_ATTEMPTS} attempts")
+        return False
+
+    async def _handle_message_async(self, message: dict, semaphore: asyncio.Semaphore) -> bool:
+        """Handle a message in a worker thread, bounded by the semaphore"""
+        # The reply pipeline is blocking network I/O, so keep it off the event loop
+        async with semaphore:
+            return await asyncio.to_thread(self._handle_message, message)
+
+    def _advance_cursor(self, message_id: str):
+        """Move the last processed message ID forward, never backward"""
+        if int(message_id) > int(self.last_processed_message_id or 0):
+            self.last_processed_message_id = str(message_id)
+
     def process_new_messages(self):
-        """Check for and reply to new messages"""
+        """Check for and reply to messages posted since the last processed message"""
+        asyncio.run(self.process_new_messages_async(asyncio.Semaphore(MAX_CONCURRENT_REPLIES)))
+
+    async def process_new_messages_async(self, semaphore: asyncio.Semaphore):
+        """Reply to messages posted since the last processed message, up to MAX_BACKFILL_PAGES pages"""
         if not self.last_processed_message_id:
             logger.warning("No baseline message ID set, skipping message processing")
             return
-            
-        messages = self.read_messages()
-        if not messages:
-            return
-        
-        # Process messages in chronological order (oldest first)
-        new_messages = []
-        for msg in reversed(messages):
-            msg_id = msg['id']
-            msg_content = msg.get('message', '')
-            author = msg.get('author', '')
-            
-            # Skip if it's any kind of bot message or reference:
-            # 1. From the bot (APP in author)
-            # 2. Message references/mentions the bot (@zerecall)
-            # 3. Message is a reply to a bot message
-            if ('APP' in author or 
-                'zerecall' in author.lower() or
-                '@zerecall' in msg_content.lower() or
-                any(ref in msg_content.lower() for ref in ['@zerecall', '<@zerecall'])):
-                logger.debug(f"Skipping bot-related message: {msg_id}")
-                continue
-            
-            # Only process if it's a new message we haven't replied to
-            if (msg_id > self.last_processed_message_id):
+
+        # Page with a local cursor: on_message advances the shared one for live messages
+        # while this runs, and paging from that would skip the messages in between
+        cursor = self.last_processed_message_id
+        for _ in range(MAX_BACKFILL_PAGES):
+            messages = await asyncio.to_thread(self.read_messages, after=cursor)
+            if not messages:
+                return
+
+            # Process messages in chronological order (oldest first)
+            new_messages = []
+            for msg in sorted(messages, key=lambda m: int(m['id'])):
+                if self._is_bot_message(msg):
+                    logger.debug("Skipping bot-related message: %s", msg['id'])
+                    continue
+
                 new_messages.append(msg)
-                logger.info(f"Found new message to process: {msg_id}")
-        
-        for message in new_messages:
-            msg_id = message['id']
-            msg_content = message.get('message', '')
-            
-            # Check if the message has already been replied to using the database
-            if not self.db.get_replied_messages(self.channel_id, msg_id):
-                if self.reply_to_message(msg_id, msg_content):
-                    # Add the message to the database as replied
-                    self.db.add_replied_message(self.channel_id, msg_id)
-                    self.last_processed_message_id = msg_id
-                    logger.info(f"Successfully processed message {msg_id}")
-                else:
-                    logger.warning(f"Failed to process message {msg_id}")
+                logger.info(f"Found new message to process: {msg['id']}")
+
+            # Look up which candidates were already replied to in a single query
+            replied = await asyncio.to_thread(
+                self.db.get_replied_set, self.channel_id, [m['id'] for m in new_messages]
+            )
+
+            pending = []
+            for message in new_messages:
+                if message['id'] in replied:
+                    logger.debug("Skipping already replied message: %s", message['id'])
+                    continue
+                pending.append(message)
+
+            await asyncio.gather(
+                *[self._handle_message_async(message, semaphore) for message in pending]
+            )
+
+            # Advance the cursors past everything fetched, including skipped bot messages;
+            # failed messages were already retried by _handle_message
+            cursor = max((msg['id'] for msg in messages), key=int)
+            self._advance_cursor(cursor)
 
+            # A short page means we have caught up with the channel
+            if len(messages) < self.message_read_count:
+                return
+
+        logger.warning(f"Stopped backfill after {MAX_BACKFILL_PAGES} pages, older missed messages are skipped")
+
+    async def _run_gateway(self):
+        """Connect to the Discord gateway and handle messages until disconnected"""
+        async with DiscordGatewayClient(self) as client:
+            await client.start(os.getenv("DISCORD_TOKEN"))
 
     def loop(self):
         """Main loop that only replies to new messages"""
@@ -198,16 +450,19 @@ class DiscordAgent:
         try:
             while True:
                 try:
-                    # Check for and reply to new messages
-                    self.process_new_messages()
-                    
-                    # Quick check interval (1 second) but don't spam the logs
-                    time.sleep(self.loop_delay)
+                    # Backfill runs from on_ready, then replies are driven by gateway events
+                    asyncio.run(self._run_gateway())
+                    return
+
+                except (discord.LoginFailure, discord.PrivilegedIntentsRequired) as e:
+                    # Retrying cannot fix a bad token or a message content intent that is not enabled
+                    logger.error(f"\n❌ Discord login failed: {e}")
+                    return
 
                 except Exception as e:
-                    logger.error(f"\n❌ Error in loop iteration: {e}")
-                    time.sleep(2)  # Short delay on error before retry
+                    logger.error(f"\n❌ Discord gateway error: {e}")
+                    time.sleep(GATEWAY_RETRY_DELAY)  # Short delay before reconnecting
 
         except KeyboardInterrupt:
             logger.info("\n🛑 Discord agent loop stopped by user.")
-            return
\ No newline at end of file
+            return
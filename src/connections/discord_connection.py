@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 from typing import Dict, Any
 from dotenv import set_key, load_dotenv
@@ -9,6 +10,8 @@ import json
 
 logger = logging.getLogger("connections.discord_connection")
 
+MAX_RATE_LIMIT_RETRIES = 3  # Times a rate limited (429) request is retried after its Retry-After
+
 
 class DiscordConnectionError(Exception):
     """Base exception for Discord connection errors"""
@@ -81,6 +84,12 @@ class DiscordConnection(BaseConnection):
                         int,
                         "Number of messages to retrieve",
                     ),
+                    ActionParameter(
+                        "after",
+                        False,
+                        str,
+                        "Only retrieve messages after this message id",
+                    ),
                 ],
                 description="Get the latest messages from a channel",
             ),
@@ -133,6 +142,22 @@ class DiscordConnection(BaseConnection):
                 ],
                 description="Reply to an existing message",
             ),
+            "edit-message": Action(
+                name="edit-message",
+                parameters=[
+                    ActionParameter(
+                        "channel_id",
+                        True,
+                        str,
+                        "The channel id of the message to edit",
+                    ),
+                    ActionParameter(
+                        "message_id", True, str, "ID of the message to edit"
+                    ),
+                    ActionParameter("message", True, str, "New message content"),
+                ],
+                description="Edit a message posted by the bot",
+            ),
             "react-to-message": Action(
                 name="react-to-message",
                 parameters=[
@@ -258,10 +283,14 @@ class DiscordConnection(BaseConnection):
         logger.info(f"Retrieved {len(formatted_response)} channels")
         return formatted_response
 
-    def read_messages(self, channel_id: str, count: int, **kwargs) -> dict:
+    def read_messages(
+        self, channel_id: str, count: int, after: str = None, **kwargs
+    ) -> dict:
         """Reading messages in a channel"""
-        logger.debug("Sending a new message")
+        logger.debug("Reading messages")
         request_path = f"/channels/{channel_id}/messages?limit={count}"
+        if after:
+            request_path += f"&after={after}"
         response = self._get_request(request_path)
         formatted_response = self._format_messages(response)
 
@@ -310,6 +339,20 @@ class DiscordConnection(BaseConnection):
         logger.info("Reply message posted successfully")
         return formatted_response
 
+    def edit_message(
+        self, channel_id: str, message_id: str, message: str, **kwargs
+    ) -> dict:
+        """Edit a message"""
+        logger.debug("Editing a message")
+
+        request_path = f"/channels/{channel_id}/messages/{message_id}"
+        payload = json.dumps({"content": f"{message}"})
+        response = self._patch_request(request_path, payload)
+        formatted_response = self._format_posted_message(response)
+
+        logger.info("Message edited successfully")
+        return formatted_response
+
     def react_to_message(
         self, channel_id: str, message_id: str, emoji_name: str, **kwargs
     ) -> None:
@@ -390,7 +433,7 @@ class DiscordConnection(BaseConnection):
             "Accept": "application/json",
             "Authorization": self._get_request_auth_token(),
         }
-        response = requests.request("PUT", url, headers=headers, data={})
+        response = self._send_request("PUT", url, headers, {})
         if response.status_code != 204:
             raise DiscordAPIError(
                 f"Failed to called PUT to Discord: {response.status_code} - {response.text}"
@@ -405,13 +448,28 @@ class DiscordConnection(BaseConnection):
             "Accept": "application/json",
             "Authorization": self._get_request_auth_token(),
         }
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = self._send_request("POST", url, headers, payload)
         if response.status_code != 200:
             raise DiscordAPIError(
                 f"Failed to call POST to Discord: {response.status_code} - {response.text}"
             )
         return json.loads(response.text)
 
+    def _patch_request(self, url_path: str, payload: str) -> dict:
+        """Helper method to make PATCH request"""
+        url = f"{self.base_url}{url_path}"
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": self._get_request_auth_token(),
+        }
+        response = self._send_request("PATCH", url, headers, payload)
+        if response.status_code != 200:
+            raise DiscordAPIError(
+                f"Failed to call PATCH to Discord: {response.status_code} - {response.text}"
+            )
+        return json.loads(response.text)
+
     def _get_request(self, url_path: str) -> str:
         """Helper method to make GET request"""
         url = f"{self.base_url}{url_path}"
@@ -419,14 +477,23 @@ class DiscordConnection(BaseConnection):
             "Accept": "application/json",
             "Authorization": self._get_request_auth_token(),
         }
-        print(headers)
-        response = requests.request("GET", url, headers=headers, data={})
+        response = self._send_request("GET", url, headers, {})
         if response.status_code != 200:
             raise DiscordAPIError(
                 f"Failed to call GET to Discord: {response.status_code} - {response.text}"
             )
         return json.loads(response.text)
 
+    def _send_request(self, method: str, url: str, headers: dict, data) -> requests.Response:
+        """Helper method to send a request, waiting out rate limits (429) per Retry-After"""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            response = requests.request(method, url, headers=headers, data=data)
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            retry_after = float(response.headers.get("Retry-After", 1))
+            logger.warning(f"Rate limited by Discord on {method} {url}, retrying in {retry_after}s")
+            time.sleep(retry_after)
+
     def _get_request_auth_token(self) -> str:
         return f"Bot {os.getenv('DISCORD_TOKEN')}"
 
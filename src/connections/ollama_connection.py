@@ -1,7 +1,7 @@
 import logging
 import requests
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
 
 logger = logging.getLogger("connections.ollama_connection")
@@ -53,6 +53,15 @@ class OllamaConnection(BaseConnection):
                 ],
                 description="Generate text using Ollama's running model"
             ),
+            "stream-text": Action(
+                name="stream-text",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                ],
+                description="Stream generated text chunks from Ollama's running model"
+            ),
         }
 
     def configure(self) -> bool:
@@ -97,6 +106,10 @@ class OllamaConnection(BaseConnection):
 
     def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
         """Generate text using Ollama API with streaming support"""
+        return "".join(self.stream_text(prompt, system_prompt, model))
+
+    def stream_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> Iterator[str]:
+        """Yield generated text chunks from the Ollama API as they arrive"""
         try:
             url = f"{self.base_url}/api/generate"
             payload = {
@@ -109,22 +122,16 @@ class OllamaConnection(BaseConnection):
             if response.status_code != 200:
                 raise OllamaAPIError(f"API error: {response.status_code} - {response.text}")
 
-            # Initialize an empty string to store the complete response
-            full_response = ""
-
             # Process each line of the response as a JSON object
             for line in response.iter_lines():
                 if line:
                     try:
-                        # Parse the JSON object
+                        # Parse the JSON object and yield its "response" field
                         data = json.loads(line.decode("utf-8"))
-                        # Append the "response" field to the full response
-                        full_response += data.get("response", "")
+                        yield data.get("response", "")
                     except json.JSONDecodeError as e:
                         raise OllamaAPIError(f"Failed to parse JSON: {e}")
 
-            return full_response
-
         except Exception as e:
             raise OllamaAPIError(f"Text generation failed: {e}")
 
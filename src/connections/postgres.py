@@ -1,98 +1,376 @@
 import os
+import hashlib
 import logging
+import weakref
+import threading
 import psycopg2
+import psycopg2.pool
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from pgvector.psycopg2 import register_vector
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 from psycopg2.extras import Json
-from typing import Set, Optional
+from typing import List, Set, Optional
 
 logger = logging.getLogger("db_handler")
 
+load_dotenv()
+POSTGRES_URL = os.getenv("POSTGRES_URL")
+OPENAI_KEY = os.getenv("OPENAI_KEY")
+
+EMBEDDING_CACHE_SIZE = 1024  # Number of query embeddings kept in memory
+EMBEDDING_CACHE_TTL_DAYS = 7  # How long persisted query embeddings stay valid
+SEMANTIC_CACHE_SIZE = 2048  # Number of query results kept in the semantic cache
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Minimum cosine similarity for a semantic cache hit
+HNSW_EF_SEARCH = 40  # Candidate list size for HNSW index scans
+IVFFLAT_MIN_ROWS = 10000  # Smallest table an ivfflat index is built for, so its centroids are meaningful
+IVFFLAT_ROWS_PER_LIST = 1000  # pgvector's recommended rows per list for tables under 1M rows
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 8
+
+# Hot-path statements prepared once per pooled connection
+PREPARED_STATEMENTS = {
+    "claim_message": (
+        "INSERT INTO message_tracking (channel_id, message_id) VALUES ($1, $2) "
+        "ON CONFLICT DO NOTHING RETURNING 1"
+    ),
+}
+
+def _quantize(vec: np.ndarray) -> tuple:
+    """Quantize a float32 vector to int8 codes with a per-vector scale"""
+    scale = float(np.abs(vec).max()) / 127 or 1.0
+    codes = np.round(vec / scale).astype(np.int8)
+    return codes, scale
+
 class DatabaseHandler:
     def __init__(self):
-        load_dotenv()
-            
-        self.conn_string = os.getenv("POSTGRES_URL")
+        self.conn_string = POSTGRES_URL
         if not self.conn_string:
             raise ValueError("POSTGRES_URL environment variable not set")
-        
+
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, self.conn_string
+        )
+        self._prepared_conns = weakref.WeakSet()
+        self._register_vector_type()
+
+        self.embeddings = OpenAIEmbeddings(api_key=OPENAI_KEY)
+        # In-memory LRU of query embeddings keyed by the SHA-256 of the query text
+        self._embedding_cache = OrderedDict()
+        # Semantic cache of recent query results: normalized query vectors stored as int8 codes
+        # (N x d) with per-row float32 scales, their (query, limit, similar_content) entries
+        # and last-use ticks for LRU eviction
+        self._cache_codes = None
+        self._cache_scales = np.zeros(0, dtype=np.float32)
+        self._cache_entries = []
+        self._cache_ticks = np.zeros(0, dtype=np.int64)
+        self._cache_clock = 0
+        # Guards both in-memory caches, since replies are generated from worker threads
+        self._cache_lock = threading.Lock()
+        # (setting, value) applied before each similarity query for the index in use, if any;
+        # set by the background index build once its index is usable
+        self._index_search_setting = None
+
         self.setup_database()
 
+        # Build the ANN index in the background so startup doesn't wait on it
+        threading.Thread(
+            target=self._setup_embedding_index, name="embedding-index", daemon=True
+        ).start()
+
+    @contextmanager
+    def _autocommit_conn(self):
+        """Borrow a connection from the pool in autocommit mode, for statements that can't run in a transaction"""
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = True
+            yield conn
+        finally:
+            conn.autocommit = False
+            self.pool.putconn(conn)
+
+    @contextmanager
+    def _conn(self):
+        """Borrow a connection from the pool, committing on success and rolling back on error"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def _register_vector_type(self):
+        """Register the pgvector adapter so vectors travel as numpy arrays instead of hand-built strings"""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            conn.commit()
+            register_vector(conn, globally=True)
+        finally:
+            self.pool.putconn(conn)
+
+    def _execute_prepared(self, conn, cur, name: str, params: tuple):
+        """Execute a statement from PREPARED_STATEMENTS, preparing it on first use per connection"""
+        if conn not in self._prepared_conns:
+            for statement_name, statement in PREPARED_STATEMENTS.items():
+                cur.execute(f"PREPARE {statement_name} AS {statement}")
+            self._prepared_conns.add(conn)
+
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name}({placeholders})", params)
+
     def setup_database(self):
         """Initialize database tables"""
-        with psycopg2.connect(self.conn_string) as conn:
-            with conn.cursor() as cur:
-                # Table for message tracking
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS message_tracking (
-                        channel_id TEXT NOT NULL,
-                        message_id TEXT NOT NULL,
-                        processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                        PRIMARY KEY (channel_id, message_id)
-                    )
-                """)
-            
-                
-                conn.commit()
+        with self._conn() as conn, conn.cursor() as cur:
+            # Table for message tracking
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS message_tracking (
+                    channel_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (channel_id, message_id)
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS message_tracking_processed_at_idx
+                ON message_tracking (processed_at)
+            """)
 
-    def get_replied_messages(self, channel_id: str, message_id: str) -> bool:
-        """Check if a message has been replied to"""
-        with psycopg2.connect(self.conn_string) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT EXISTS(SELECT 1 FROM message_tracking WHERE channel_id = %s AND message_id = %s)",
-                    (channel_id, message_id)
+            # Table for persisting query embeddings across restarts
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS query_embedding_cache (
+                    text_hash TEXT PRIMARY KEY,
+                    embedding vector NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
                 )
-                return cur.fetchone()[0]
+            """)
 
-    def add_replied_message(self, channel_id: str, message_id: str):
-        """Record a replied message"""
-        with psycopg2.connect(self.conn_string) as conn:
-            with conn.cursor() as cur:
+    def _setup_embedding_index(self):
+        """Build the ANN index for cosine search over the knowledge base, if it has been loaded"""
+        try:
+            # code_embeddings is written by an external loader, so the index is built
+            # CONCURRENTLY (outside any transaction) to avoid blocking its inserts
+            with self._autocommit_conn() as conn, conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('code_embeddings')")
+                if cur.fetchone()[0]:
+                    self._index_search_setting = self._create_embedding_index(cur)
+        except psycopg2.Error as e:
+            logger.warning(f"Could not set up embedding index: {e}")
+
+    def _create_embedding_index(self, cur) -> Optional[tuple]:
+        """Create a cosine index on code_embeddings, falling back to ivfflat on older pgvector"""
+        if self._try_create_index(cur, "code_embeddings_hnsw", """
+            CREATE INDEX CONCURRENTLY code_embeddings_hnsw ON code_embeddings
+            USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+        """):
+            return ("hnsw.ef_search", HNSW_EF_SEARCH)
+
+        # Reuse an ivfflat index from an earlier run, reading back its list count
+        cur.execute("""
+            SELECT c.reloptions FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = 'code_embeddings_ivfflat' AND i.indisvalid
+        """)
+        row = cur.fetchone()
+        if row:
+            options = dict(option.split("=", 1) for option in row[0] or [])
+            lists = int(options.get("lists", 100))
+        else:
+            # ivfflat centroids are trained on the rows present at build time,
+            # so only build it once the table holds enough data
+            cur.execute("SELECT count(*) FROM code_embeddings")
+            rows = cur.fetchone()[0]
+            if rows < IVFFLAT_MIN_ROWS:
+                logger.info(f"Skipping ivfflat index: code_embeddings has only {rows} rows")
+                return None
+
+            lists = rows // IVFFLAT_ROWS_PER_LIST
+            if not self._try_create_index(cur, "code_embeddings_ivfflat", f"""
+                CREATE INDEX CONCURRENTLY code_embeddings_ivfflat ON code_embeddings
+                USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})
+            """):
+                return None
+
+        # Probe about sqrt(lists) lists per query, as pgvector recommends
+        return ("ivfflat.probes", max(1, round(lists ** 0.5)))
+
+    def _try_create_index(self, cur, name: str, statement: str) -> bool:
+        """Run a CREATE INDEX CONCURRENTLY statement unless a valid index exists, returning False if it fails"""
+        cur.execute(
+            "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = %s",
+            (name,)
+        )
+        row = cur.fetchone()
+        if row and row[0]:
+            return True
+        if row:
+            # A failed concurrent build leaves an invalid index behind; drop it and rebuild
+            cur.execute(f"DROP INDEX CONCURRENTLY {name}")
+
+        try:
+            cur.execute(statement)
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Could not create embedding index: {e}")
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            return False
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Get the embedding for a query, checking the memory and database caches first"""
+        text_hash = hashlib.sha256(query.encode()).hexdigest()
+
+        with self._cache_lock:
+            embedding = self._embedding_cache.get(text_hash)
+            if embedding is not None:
+                self._embedding_cache.move_to_end(text_hash)
+                return embedding
+
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT embedding FROM query_embedding_cache
+                WHERE text_hash = %s
+                AND created_at > NOW() - make_interval(days => %s)
+                """,
+                (text_hash, EMBEDDING_CACHE_TTL_DAYS)
+            )
+            row = cur.fetchone()
+
+        if row:
+            embedding = row[0]
+        else:
+            # Embed without holding a pooled connection open across the OpenAI round-trip
+            embedding = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            with self._conn() as conn, conn.cursor() as cur:
                 cur.execute(
-                    "INSERT INTO message_tracking (channel_id, message_id) VALUES (%s, %s)",
-                    (channel_id, message_id)
+                    """
+                    INSERT INTO query_embedding_cache (text_hash, embedding)
+                    VALUES (%s, %s)
+                    ON CONFLICT (text_hash)
+                    DO UPDATE SET embedding = EXCLUDED.embedding, created_at = CURRENT_TIMESTAMP
+                    """,
+                    (text_hash, embedding)
                 )
-                conn.commit()
+
+        with self._cache_lock:
+            self._embedding_cache[text_hash] = embedding
+            if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        return embedding
+
+    def claim_message(self, channel_id: str, message_id: str) -> bool:
+        """Record a message as replied, returning False if it was already recorded"""
+        with self._conn() as conn, conn.cursor() as cur:
+            self._execute_prepared(conn, cur, "claim_message", (channel_id, message_id))
+            return cur.fetchone() is not None
+
+    def get_replied_set(self, channel_id: str, message_ids: List[str]) -> Set[str]:
+        """Return the subset of message_ids that have already been replied to"""
+        if not message_ids:
+            return set()
+
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT message_id FROM message_tracking WHERE channel_id = %s AND message_id = ANY(%s)",
+                (channel_id, list(message_ids))
+            )
+            return {row[0] for row in cur.fetchall()}
 
     def get_similar_content(self, query: str, limit: int = 5) -> list:
         """Get similar content using vector similarity"""
         try:
-            load_dotenv()
-            openai_api_key=os.getenv("OPENAI_KEY")
-            embeddings = OpenAIEmbeddings(
-                api_key=openai_api_key
-            )
-            
             # Generate embedding for query
-            query_embedding = embeddings.embed_query(query)
+            query_embedding = self._embed_query(query)
+
+            query_vec = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+
+            cached = self._semantic_cache_lookup(query_vec, limit)
+            if cached is not None:
+                return cached
             
-            with psycopg2.connect(self.conn_string) as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT content, embedding <=> %s::vector AS similarity
-                        FROM code_embeddings
-                        ORDER BY similarity ASC
-                        LIMIT %s
-                        """,
-                        (f"[{','.join(map(str, query_embedding))}]", limit)
-                    )
-                    return cur.fetchall()
+            with self._conn() as conn, conn.cursor() as cur:
+                if self._index_search_setting:
+                    setting, value = self._index_search_setting
+                    cur.execute(f"SET LOCAL {setting} = %s", (value,))
+                cur.execute(
+                    """
+                    SELECT content, embedding <=> %s AS similarity
+                    FROM code_embeddings
+                    ORDER BY similarity ASC
+                    LIMIT %s
+                    """,
+                    (query_embedding, limit)
+                )
+                similar_content = cur.fetchall()
+
+            self._semantic_cache_store(query_vec, query, limit, similar_content)
+            return similar_content
                     
         except Exception as e:
             logger.error(f"Error getting similar content: {e}")
             return []
 
+    def _semantic_cache_lookup(self, query_vec: np.ndarray, limit: int) -> Optional[list]:
+        """Return cached similar content for a query close enough to a previous one"""
+        with self._cache_lock:
+            if self._cache_codes is None:
+                return None
+
+            scores = (self._cache_codes @ query_vec) * self._cache_scales
+            idx = int(np.argmax(scores))
+            _, cached_limit, similar_content = self._cache_entries[idx]
+            if scores[idx] < SEMANTIC_CACHE_THRESHOLD or cached_limit < limit:
+                return None
+
+            self._cache_clock += 1
+            self._cache_ticks[idx] = self._cache_clock
+            return similar_content[:limit]
+
+    def _semantic_cache_store(self, query_vec: np.ndarray, query: str, limit: int, similar_content: list):
+        """Add a query result to the semantic cache, evicting the least recently used entry when full"""
+        with self._cache_lock:
+            self._cache_clock += 1
+            entry = (query, limit, similar_content)
+
+            codes, scale = _quantize(query_vec)
+
+            if self._cache_codes is None:
+                self._cache_codes = codes[np.newaxis, :]
+                self._cache_scales = np.array([scale], dtype=np.float32)
+                self._cache_entries = [entry]
+                self._cache_ticks = np.array([self._cache_clock], dtype=np.int64)
+            elif len(self._cache_entries) < SEMANTIC_CACHE_SIZE:
+                self._cache_codes = np.vstack([self._cache_codes, codes])
+                self._cache_scales = np.append(self._cache_scales, np.float32(scale))
+                self._cache_entries.append(entry)
+                self._cache_ticks = np.append(self._cache_ticks, self._cache_clock)
+            else:
+                idx = int(np.argmin(self._cache_ticks))
+                self._cache_codes[idx] = codes
+                self._cache_scales[idx] = scale
+                self._cache_entries[idx] = entry
+                self._cache_ticks[idx] = self._cache_clock
+
     def cleanup_old_messages(self, days: int = 30):
         """Clean up old message records"""
-        with psycopg2.connect(self.conn_string) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    DELETE FROM message_tracking 
-                    WHERE processed_at < NOW() - INTERVAL '%s days'
-                    """,
-                    (days,)
-                )
-                conn.commit()
\ No newline at end of file
+        with self._conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM message_tracking
+                WHERE processed_at < NOW() - make_interval(days => %s)
+                """,
+                (days,)
+            )
+            # Expired query embeddings are never read again, so purge them too
+            cur.execute(
+                """
+                DELETE FROM query_embedding_cache
+                WHERE created_at <= NOW() - make_interval(days => %s)
+                """,
+                (EMBEDDING_CACHE_TTL_DAYS,)
+            )
\ No newline at end of file
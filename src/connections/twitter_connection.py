@@ -1,13 +1,19 @@
 import os
+import time
 import logging
 from typing import Dict, Any, List, Tuple
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth1Session
+from urllib3.util.retry import Retry
 from dotenv import set_key, load_dotenv
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
 from src.helpers import print_h_bar
 
 logger = logging.getLogger("connections.twitter_connection")
 
+CONFIGURATION_CHECK_TTL = 300  # Seconds a successful is_configured check is reused
+UNKNOWN_AUTHOR = {'name': "Unknown", 'username': "Unknown"}
+
 class TwitterConnectionError(Exception):
     """Base exception for Twitter connection errors"""
     pass
@@ -21,9 +27,21 @@ class TwitterAPIError(TwitterConnectionError):
     pass
 
 class TwitterConnection(BaseConnection):
+    # HTTP method name -> unbound session method, resolved once instead of per request
+    _METHOD_TBL = {
+        'get': OAuth1Session.get,
+        'post': OAuth1Session.post,
+        'put': OAuth1Session.put,
+        'delete': OAuth1Session.delete,
+    }
+    _EXPECTED_STATUS = frozenset((200, 201))
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self._oauth_session = None
+        self.base_url = "https://api.twitter.com/2/"
+        self._credentials = None
+        self._configured_at = None
 
     @property
     def is_llm_provider(self) -> bool:
@@ -96,6 +114,9 @@ class TwitterConnection(BaseConnection):
 
     def _get_credentials(self) -> Dict[str, str]:
         """Get Twitter credentials from environment with validation"""
+        if self._credentials is not None:
+            return self._credentials
+
         logger.debug("Retrieving Twitter credentials")
         load_dotenv()
 
@@ -121,6 +142,7 @@ class TwitterConnection(BaseConnection):
             raise TwitterConfigurationError(error_msg)
 
         logger.debug("All required credentials found")
+        self._credentials = credentials
         return credentials
      
     def _make_request(self, method: str, endpoint: str, **kwargs) -> dict:
@@ -128,21 +150,21 @@ class TwitterConnection(BaseConnection):
         Make a request to the Twitter API with error handling
 
         Args:
-            method: HTTP method ('get', 'post', etc.)
+            method: Lowercase HTTP method ('get', 'post', 'put' or 'delete')
             endpoint: API endpoint path
             **kwargs: Additional request parameters
 
         Returns:
             Dict containing the API response
         """
-        logger.debug(f"Making {method.upper()} request to {endpoint}")
+        logger.debug("Making %s request to %s", method, endpoint)
         try:
             oauth = self._get_oauth()
-            full_url = f"https://api.twitter.com/2/{endpoint.lstrip('/')}"
+            full_url = self.base_url + endpoint.lstrip('/')
 
-            response = getattr(oauth, method.lower())(full_url, **kwargs)
+            response = self._METHOD_TBL[method](oauth, full_url, **kwargs)
 
-            if response.status_code not in [200, 201]:
+            if response.status_code not in self._EXPECTED_STATUS:
                 logger.error(
                     f"Request failed: {response.status_code} - {response.text}"
                 )
@@ -150,7 +172,7 @@ class TwitterConnection(BaseConnection):
                     f"Request failed with status {response.status_code}: {response.text}"
                 )
 
-            logger.debug(f"Request successful: {response.status_code}")
+            logger.debug("Request successful: %s", response.status_code)
             return response.json()
 
         except Exception as e:
@@ -169,6 +191,16 @@ class TwitterConnection(BaseConnection):
                     resource_owner_secret=credentials[
                         'TWITTER_ACCESS_TOKEN_SECRET'],
                 )
+                # Reuse pooled HTTPS connections across API calls, retrying transient failures
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=10,
+                    max_retries=Retry(total=3,
+                                      backoff_factor=0.2,
+                                      status_forcelist=[429, 500, 502, 503, 504],
+                                      raise_on_status=False))
+                self._oauth_session.mount("https://", adapter)
+                self._oauth_session.headers['User-Agent'] = "ZerePy"
                 logger.debug("OAuth session created successfully")
             except Exception as e:
                 logger.error(f"Failed to create OAuth session: {str(e)}")
@@ -185,7 +217,7 @@ class TwitterConnection(BaseConnection):
                                         params={'user.fields': 'id,username'})
             user_id = response['data']['id']
             username = response['data']['username']
-            logger.debug(f"Retrieved user ID: {user_id}, username: {username}")
+            logger.debug("Retrieved user ID: %s, username: %s", user_id, username)
             
             return user_id, username
         except Exception as e:
@@ -203,7 +235,7 @@ class TwitterConnection(BaseConnection):
             error_msg = f"{context} exceeds 280 character limit"
             logger.error(error_msg)
             raise ValueError(error_msg)
-        logger.debug(f"Tweet text validation passed for {context.lower()}")
+        logger.debug("Tweet text validation passed for %s", context.lower())
 
     def configure(self) -> None:
         """Sets up Twitter API authentication"""
@@ -289,6 +321,8 @@ class TwitterConnection(BaseConnection):
                 resource_owner_secret=oauth_tokens.get('oauth_token_secret'))
 
             self._oauth_session = temp_oauth
+            self._credentials = None
+            self._configured_at = None
             user_id, username = self._get_authenticated_user_info()
 
             # Save to .env
@@ -309,7 +343,7 @@ class TwitterConnection(BaseConnection):
 
             for key, value in env_vars.items():
                 set_key('.env', key, value)
-                logger.debug(f"Saved {key} to .env")
+                logger.debug("Saved %s to .env", key)
 
             logger.info("\n✅ Twitter authentication successfully set up!")
             logger.info(
@@ -325,6 +359,10 @@ class TwitterConnection(BaseConnection):
     def is_configured(self, verbose = False) -> bool:
         """Check if Twitter credentials are configured and valid"""
         logger.debug("Checking Twitter configuration status")
+        if (self._configured_at is not None
+                and time.monotonic() - self._configured_at < CONFIGURATION_CHECK_TTL):
+            return True
+
         try:
             # check if credentials exist
             self._get_credentials()
@@ -332,6 +370,7 @@ class TwitterConnection(BaseConnection):
             # Test the configuration by making a simple API call
             self._get_authenticated_user_info()
             logger.debug("Twitter configuration is valid")
+            self._configured_at = time.monotonic()
             return True
 
         except Exception as e:
@@ -368,7 +407,7 @@ class TwitterConnection(BaseConnection):
         if count is None:
             count = self.config["timeline_read_count"]
             
-        logger.debug(f"Reading timeline, count: {count}")
+        logger.debug("Reading timeline, count: %s", count)
         credentials = self._get_credentials()
 
         params = {
@@ -396,17 +435,11 @@ class TwitterConnection(BaseConnection):
         }
 
         for tweet in tweets:
-            author_id = tweet['author_id']
-            author_info = user_dict.get(author_id, {
-                'name': "Unknown",
-                'username': "Unknown"
-            })
-            tweet.update({
-                'author_name': author_info['name'],
-                'author_username': author_info['username']
-            })
-
-        logger.debug(f"Retrieved {len(tweets)} tweets")
+            author_info = user_dict.get(tweet['author_id'], UNKNOWN_AUTHOR)
+            tweet['author_name'] = author_info['name']
+            tweet['author_username'] = author_info['username']
+
+        logger.debug("Retrieved %s tweets", len(tweets))
         return tweets
 
     def get_latest_tweets(self,
@@ -414,7 +447,7 @@ class TwitterConnection(BaseConnection):
                           count: int = 10,
                           **kwargs) -> list:
         """Get latest tweets for a user"""
-        logger.debug(f"Getting latest tweets for {username}, count: {count}")
+        logger.debug("Getting latest tweets for %s, count: %s", username, count)
 
         credentials = self._get_credentials()
         params = {
@@ -428,7 +461,7 @@ class TwitterConnection(BaseConnection):
                                       params=params)
 
         tweets = response.get("data", [])
-        logger.debug(f"Retrieved {len(tweets)} tweets")
+        logger.debug("Retrieved %s tweets", len(tweets))
         return tweets
 
 
@@ -444,7 +477,7 @@ class TwitterConnection(BaseConnection):
 
     def reply_to_tweet(self, tweet_id: str, message: str, **kwargs) -> dict:
         """Reply to an existing tweet"""
-        logger.debug(f"Replying to tweet {tweet_id}")
+        logger.debug("Replying to tweet %s", tweet_id)
         self._validate_tweet_text(message, "Reply")
 
         response = self._make_request('post',
@@ -461,7 +494,7 @@ class TwitterConnection(BaseConnection):
 
     def like_tweet(self, tweet_id: str, **kwargs) -> dict:
         """Like a tweet"""
-        logger.debug(f"Liking tweet {tweet_id}")
+        logger.debug("Liking tweet %s", tweet_id)
         credentials = self._get_credentials()
 
         response = self._make_request(
@@ -474,7 +507,7 @@ class TwitterConnection(BaseConnection):
     
     def get_tweet_replies(self, tweet_id: str, count: int = 10, **kwargs) -> List[dict]:
         """Fetch replies to a specific tweet"""
-        logger.debug(f"Fetching replies for tweet {tweet_id}, count: {count}")
+        logger.debug("Fetching replies for tweet %s, count: %s", tweet_id, count)
         
         params = {
             "query": f"conversation_id:{tweet_id} is:reply",